@@ -2,6 +2,8 @@
 
 contains the classes to handle ansatze
 """
+from functools import partial
+
 import pennylane as qml
 import pennylane.numpy as np
 
@@ -26,7 +28,7 @@ class AnsatzBuilder:
         self.layer_type = layer_type
         self.variables_shape = None
         self.ansatz = lambda *_, **__: None
-        self.wires = range(num_q)
+        self.wires = list(range(num_q))
         if variables_range is None:
             variables_range = [0, 2 * np.pi]
         self.variables_range = variables_range
@@ -52,10 +54,10 @@ class AnsatzBuilder:
                     pass
 
     def check_shape(self, variables):
-        if np.prod(variables.shape) != np.prod(self.variables_shape):
+        if tuple(np.shape(variables)) != tuple(self.variables_shape):
             raise ValueError("variables shape is incorrect. "
                              f"Expected {self.variables_shape}, "
-                             f"got {variables.shape}")
+                             f"got {np.shape(variables)}")
 
     def build(self, ansatz=None, variables_shape=None):
 
@@ -68,14 +70,9 @@ class AnsatzBuilder:
             self.ansatz = ansatz
 
         elif self.layer_type == "template":
-            layers = self.get_layers()
-
-            def ansatz(variables):
-                self.check_shape(variables)
-                variables = variables.reshape(self.variables_shape)
-                layers(variables)
-
-            self.ansatz = ansatz
+            # the shape of the variables is checked once by the model,
+            # so that the ansatz only emits gates
+            self.ansatz = self.get_layers()
 
         else:
             raise ValueError("Invalid layer_type for ansatz building. "
@@ -163,11 +160,8 @@ class AnsatzBuilder:
             self.variables_shape = qml.templates.layers. \
                 StronglyEntanglingLayers.shape(self.num_layers, self.num_q)
 
-            def layers(variables):
-                qml.templates.layers.StronglyEntanglingLayers(
-                    variables,
-                    wires=range(self.num_q)
-                )
+            layers = partial(qml.templates.layers.StronglyEntanglingLayers,
+                             wires=self.wires)
         else:
             self.stack_layer()
             layers = self.unstack_layer()
@@ -2,22 +2,50 @@
     contains the base class of quantum neural networks
     based on pennylane
 """
+import gc
 import time
 import linecache
+from importlib import import_module
 
+import numpy as onp
 import pennylane as qml
 import pennylane.numpy as np
 import tensorflow as tf
-from pennylane._grad import grad as get_gradient
+from scipy.special import softmax
 
 from prevision_quantum_nn.models.qnn import QuantumNeuralNetwork
 from prevision_quantum_nn.models.utilities.losses \
-    import square_loss, cross_entropy
+    import square_loss, softmax_cross_entropy
 from prevision_quantum_nn.models.utilities.to_categorical import to_categorical
 
 OPTIMIZER_NAMES = ["SGD", "Adagrad", "Adam", "RMSProp"]
 
 
+def import_optional(module_name, extra):
+    """Imports a dependency that is only needed by some configurations.
+
+    jax and optax are only used by the jax interface, catalyst only when
+    use_qjit is True and psutil only when memory_limit is set, so that
+    they are not required by the other models.
+
+    Args:
+        module_name (str):name of the module to be imported
+        extra (str):setup extra providing the module
+
+    Returns:
+        module: the imported module
+
+    Raises:
+        ImportError: if the module is not installed
+    """
+    try:
+        return import_module(module_name)
+    except ImportError as error:
+        raise ImportError(f"{module_name} is required by this model, "
+                          f"install it with: pip install "
+                          f"prevision-quantum-nn[{extra}]") from error
+
+
 class PennylaneNeuralNetwork(QuantumNeuralNetwork):
     """Class PennylaneNeuralNetwork.
 
@@ -28,8 +56,14 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
         batch_size (int):size of the batch with which the training
             should be performed
         verbose (bool):sets the verbosity to on if True and off if False
-        interface (str):interface of the pennylane backend. Can be tf
-            or autograd
+        interface (str):interface of the pennylane backend. Can be tf,
+            autograd or jax (qubit architecture only)
+        use_qjit (bool):with the jax interface, if True, the training step
+            is compiled ahead of time with catalyst instead of jax.jit
+        clear_cache_period (int):period in iterations at which the line
+            cache filled by the strawberryfields.tf backend is cleared
+        memory_limit (int):resident memory in bytes above which the garbage
+            collector is called during training, if None, never called
         learning_rate: learning rate at which the fitting phase needs to
             be performed
 
@@ -43,6 +77,9 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
         neural_network(self, var, features=None)
             Main method that is decorated by the qml.qnode decorator.
             This will set the structure of the neural network
+        batched_neural_network(self, var, features)
+            neural_network evaluated over a batch of features,
+            only available with qubit models
         cost(self, var, features, labels)
             cost function to be optimized
     """
@@ -62,10 +99,17 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
         self.interface = self.params.get("interface", "autograd")
         self.layer_type = self.params.get("layer_type", "template")
         self.encoding = self.params.get("encoding", None)
+        self.use_qjit = self.params.get("use_qjit", False)
+        self.clear_cache_period = self.params.get("clear_cache_period", 50)
+        self.memory_limit = self.params.get("memory_limit", None)
         self.optimizer = None
+        self.opt_state = None
+        self.train_step = None
+        self.compiled_cost = None
         self.var = None
         self.dev = None
         self.neural_network = lambda *_, **__: None
+        self.batched_neural_network = None
         self.backend = None
         self.training_type = self.params.get("training_type","default")
         self.layerwise_learning = self.training_type == "layerwise"
@@ -83,9 +127,48 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                 "interface",
                 "layer_type",
                 "encoding",
+                "use_qjit",
+                "clear_cache_period",
+                "memory_limit",
                 "training_type",
                 "layerwise_learning_period"]
 
+    def check_model(self):
+        """Checks the model's parameters consistency.
+
+        Raises:
+            ValueError when needed
+        """
+        super().check_model()
+
+        if not isinstance(self.clear_cache_period, int) or \
+                self.clear_cache_period < 1:
+            raise ValueError("clear_cache_period must be "
+                             "a positive integer")
+
+        if self.memory_limit is not None and \
+                (not isinstance(self.memory_limit, int) or
+                 self.memory_limit < 1):
+            raise ValueError("memory_limit must be None "
+                             "or a positive integer")
+
+    @staticmethod
+    def to_device(array):
+        """Transfers an array to the jax device.
+
+        Arrays are cast to single precision: a stable dtype lets jax reuse
+        the traced functions and halves the transferred memory.
+
+        Args:
+            array (array):array to be transferred
+
+        Returns:
+            jax.Array: device array
+        """
+        jax = import_optional("jax", "jax")
+        return jax.device_put(jax.numpy.asarray(array,
+                                                dtype=jax.numpy.float32))
+
     def initialize_weights(self, weights_file=None):
         """ initialize weights
 
@@ -93,12 +176,26 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
         """
         raise NotImplementedError("Implement this method in daughter class.")
 
+    def prepare_features(self, features):
+        """Prepares observations before they are passed through the model.
+
+        Args:
+            features (array):observations
+
+        Returns:
+            features: array
+                observations ready to be encoded
+        """
+        return features
+
     def build(self, weights_file=None):
         """ builds the optimizer and initializes weights """
         super().build()
 
         self.build_optimizer()
         self.initialize_weights(weights_file=weights_file)
+        if self.interface == "jax":
+            self.opt_state = self.optimizer.init(self.var)
         self.built = True
 
     def build_optimizer(self):
@@ -135,6 +232,111 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
             elif self.optimizer_name == "RMSProp":
                 self.optimizer = tf.keras.optimizers.RMSProp(
                     learning_rate=self.learning_rate)
+        # jax interface
+        elif self.interface == "jax":
+            optax = import_optional("optax", "jax")
+            if self.optimizer_name == "SGD":
+                self.optimizer = optax.sgd(self.learning_rate)
+            elif self.optimizer_name == "Adagrad":
+                self.optimizer = optax.adagrad(self.learning_rate)
+            elif self.optimizer_name == "Adam":
+                self.optimizer = optax.adam(self.learning_rate)
+            elif self.optimizer_name == "RMSProp":
+                self.optimizer = optax.rmsprop(self.learning_rate)
+
+    def get_batch_indices(self, num_samples, batch_size):
+        """Get the batch indices of one epoch.
+
+        With the jax interface, the permutation is drawn on the device so
+        that the batches are gathered from the device arrays without any
+        host transfer. The key is seeded from numpy, so that numpy seeding
+        still makes the runs reproducible.
+
+        Args:
+            num_samples (int):number of samples to be batched
+            batch_size (int):batch size
+
+        Returns:
+            indices: array
+                indices of the samples, of shape (num_batches, batch_size)
+        """
+        if self.interface != "jax":
+            return super().get_batch_indices(num_samples, batch_size)
+
+        jax = import_optional("jax", "jax")
+        key = jax.random.PRNGKey(onp.random.randint(2 ** 31 - 1))
+        if batch_size > num_samples:
+            return jax.random.randint(key, (1, batch_size), 0, num_samples)
+        num_batches = num_samples // batch_size
+        permutation = jax.random.permutation(key, num_samples)
+        return permutation[:num_batches * batch_size].reshape(num_batches,
+                                                              batch_size)
+
+    def build_train_step(self):
+        """Builds the jitted training step of the jax interface.
+
+        The loss, its gradient and the norm of the gradient are computed
+        in a single pass, the optimizer update being fused in the same graph.
+        If use_qjit is True, the hybrid step is compiled by catalyst.
+        """
+        jax = import_optional("jax", "jax")
+        optax = import_optional("optax", "jax")
+        ravel_pytree = import_optional("jax.flatten_util", "jax").ravel_pytree
+        if self.use_qjit:
+            catalyst = import_optional("catalyst", "qjit")
+            value_and_grad, jit = catalyst.value_and_grad, qml.qjit
+        else:
+            value_and_grad, jit = jax.value_and_grad, jax.jit
+
+        def train_step(var, opt_state, features, labels):
+            loss, gradient = value_and_grad(self.cost, argnums=2)(
+                features, labels, var)
+            updates, opt_state = self.optimizer.update(gradient, opt_state)
+            var = optax.apply_updates(var, updates)
+            norm_grad = jax.numpy.linalg.norm(ravel_pytree(gradient)[0])
+            return var, opt_state, loss, norm_grad
+
+        self.train_step = jit(train_step)
+        self.compiled_cost = jit(self.cost)
+
+    def build_tf_train_step(self):
+        """Builds the compiled training step of the tf interface.
+
+        The gradient tape is traced by tf.function and compiled with XLA,
+        the weights being updated in place. pennylane templates and
+        parameter broadcasting need static shapes, the input signature is
+        thus taken from the concrete shapes of the first batch. Batches
+        have a fixed size, so that the step is traced only once, and
+        traced again only if the shapes of the batches change.
+        """
+        def train_step(features, labels):
+            with tf.GradientTape() as tape:
+                loss = self.cost(features, labels, self.var)
+            gradients = tape.gradient(loss, [self.var])
+            self.optimizer.apply_gradients(zip(gradients, [self.var]))
+            return loss, tf.linalg.global_norm(gradients)
+
+        compiled_step = None
+        input_shapes = None
+
+        def compiled_train_step(features, labels):
+            nonlocal compiled_step, input_shapes
+            shapes = (features.shape, labels.shape)
+            if compiled_step is None:
+                # slot variables are created before the trace,
+                # not inside the XLA compiled function
+                self.optimizer.build([self.var])
+            if shapes != input_shapes:
+                input_shapes = shapes
+                compiled_step = tf.function(
+                    train_step,
+                    jit_compile=True,
+                    input_signature=[
+                        tf.TensorSpec(features.shape, tf.float64),
+                        tf.TensorSpec(labels.shape, tf.float64)])
+            return compiled_step(features, labels)
+
+        self.train_step = compiled_train_step
 
     def snapshot(self, is_best=False):
         """Snapshots the model to a file."""
@@ -151,8 +353,10 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                 tosave = self.var.numpy()
         elif self.interface == "autograd":
             tosave = self.var
+        elif self.interface == "jax":
+            tosave = onp.asarray(self.var)
 
-        np.savez(current_file, *tosave)
+        onp.savez(current_file, *tosave)
 
     def load_weights(self, weights_file):
         """Loads weights from file.
@@ -160,7 +364,7 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
         Args:
             weights_file (string):file name containing the weights
         """
-        weights_dict = np.load(weights_file)
+        weights_dict = onp.load(weights_file)
         weights_list = []
         for _, value in weights_dict.iteritems():
             weights_list.append(value)
@@ -171,6 +375,8 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                 self.var = [tf.Variable(v) for v in self.var]
             else:
                 self.var = tf.Variable(self.var)
+        elif self.interface == "jax":
+            self.var = self.to_device(self.var)
 
     def cost(self, features, labels, var):
         """Cost to be optimized during training.
@@ -184,8 +390,11 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
             loss: float
                 loss of the model given x
         """
-        model_output = \
-            [self.neural_network(var, features=x_) for x_ in features]
+        if self.batched_neural_network is not None:
+            model_output = self.batched_neural_network(var, features)
+        else:
+            model_output = \
+                [self.neural_network(var, x_) for x_ in features]
 
         # if the interface is autograd, call custom losses
         if self.interface == "autograd":
@@ -195,9 +404,7 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                 loss = square_loss(labels, model_output)
             elif self.type_problem == "multiclassification":
                 model_output = np.array(model_output)
-                preds = np.exp(model_output) / \
-                        np.sum(np.exp(model_output), axis=1)[:, None]
-                loss = cross_entropy(labels, preds)
+                loss = softmax_cross_entropy(labels, model_output)
             elif self.type_problem == "reinforcement_learning":
                 loss = np.mean(square_loss(labels, model_output))
 
@@ -214,16 +421,37 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                     keepdims=True)
             elif self.type_problem == "reinforcement_learning":
                 loss = tf.math.reduce_mean(tf.losses.MSE(labels, model_output))
+
+        # if the interface is jax, call jax.numpy losses
+        elif self.interface == "jax":
+            jax = import_optional("jax", "jax")
+            jnp = jax.numpy
+            if self.type_problem == "multiclassification":
+                loss = -jnp.mean(jnp.sum(
+                    labels * jax.nn.log_softmax(model_output, axis=1),
+                    axis=1))
+            else:
+                loss = jnp.mean((labels - model_output) ** 2)
         return loss
 
-    def step(self, features, labels, var, norm_grad=False):
+    def step(self, features, labels, var):
         """Performs one step of training.
 
+        The loss and the gradient are evaluated once, the loss being the
+        one of the weights before the update.
+
         Args:
             features(array):observations
             labels(array):labels
             var (array):weights of the model
-            index_grad(list):list of index to compute gradient
+
+        Returns:
+            var: array
+                updated weights of the model
+            loss: float
+                loss of the model before the update
+            norm_grad: float
+                norm of the gradient
         """
         if self.interface == "autograd":
             if self.layerwise_learning:
@@ -238,37 +466,46 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                         var[j].requires_grad = True
                     else:
                         var[j].requires_grad = False
-                var = self.optimizer.step(objective_cost, *var)
-                var = np.array(var)
-
-                if norm_grad:
-                    g = get_gradient(objective_cost)(var)
-                    return var, np.linalg.norm(g)
+                gradient, loss = self.optimizer.compute_grad(objective_cost,
+                                                             var,
+                                                             {})
+                var = np.array(self.optimizer.apply_grad(gradient, var))
+                norm_grad = onp.linalg.norm(onp.array(gradient))
 
             else:
                 def objective_cost(v):
                     return self.cost(features, labels, v)
 
-                var = self.optimizer.step(objective_cost, var)
+                gradient, loss = self.optimizer.compute_grad(objective_cost,
+                                                             (var,),
+                                                             {})
+                var = self.optimizer.apply_grad(gradient, (var,))[0]
+                norm_grad = onp.linalg.norm(gradient[0])
 
-                if norm_grad:
-                    g = get_gradient(objective_cost)(var)
-                    return var, np.linalg.norm(g)
+        elif self.interface == "tf" and self.train_step is not None:
+            loss, norm_grad = self.train_step(tf.cast(features, tf.float64),
+                                              tf.cast(labels, tf.float64))
 
         elif self.interface == "tf":
             with tf.GradientTape() as tape:
                 loss = self.cost(features, labels, var)
-                # FIXME
-                # due to pennylane layer templating
-                # in CV, we got lists of tf.Variable
-                # in qubit, we got tf.Variables, which are not iterable
-                if isinstance(var, tf.Variable):
-                    gradients = tape.gradient(loss, [var])
-                    self.optimizer.apply_gradients(zip(gradients, [var]))
-                else:
-                    gradients = tape.gradient(loss, var)
-                    self.optimizer.apply_gradients(zip(gradients, var))
-        return var
+            # FIXME
+            # due to pennylane layer templating
+            # in CV, we got lists of tf.Variable
+            # in qubit, we got tf.Variables, which are not iterable
+            if isinstance(var, tf.Variable):
+                gradients = tape.gradient(loss, [var])
+                self.optimizer.apply_gradients(zip(gradients, [var]))
+            else:
+                gradients = tape.gradient(loss, var)
+                self.optimizer.apply_gradients(zip(gradients, var))
+            norm_grad = tf.linalg.global_norm(gradients)
+
+        elif self.interface == "jax":
+            var, self.opt_state, loss, norm_grad = \
+                self.train_step(var, self.opt_state, features, labels)
+
+        return var, loss, norm_grad
 
     def fit(self,
             train_features,
@@ -303,33 +540,64 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
 
         var = self.var
 
+        # prepared once, before the transfer to the device
+        train_features = self.prepare_features(train_features)
+        if val_features is not None:
+            val_features = self.prepare_features(val_features)
+
+        # validation loss, evaluated outside of the training step
+        cost = self.cost
+        if self.interface == "jax":
+            cost = self.compiled_cost
+
+            # transfer data to the device once for all iterations,
+            # batches are then gathered on the device
+            train_features = self.to_device(train_features)
+            train_labels = self.to_device(train_labels)
+            if val_features is not None:
+                val_features = self.to_device(val_features)
+                val_labels = self.to_device(val_labels)
+
+        # batches of one epoch, shuffled again when the epoch is over
+        if self.batch_size > 1:
+            batch_indices = self.get_batch_indices(len(train_features),
+                                                   self.batch_size)
+
+        # the resident memory is only monitored if a limit is set
+        process = None
+        if self.memory_limit is not None:
+            process = import_optional("psutil", "memory").Process()
+
         # iterate
         stopping_criterion = False
         while not stopping_criterion and self.iteration < self.max_iterations:
 
             if self.batch_size > 1:
-                x_train, y_train = self.get_random_batch(train_features,
-                                                         train_labels,
-                                                         self.batch_size)
+                batch_number = self.iteration % len(batch_indices)
+                if batch_number == 0 and self.iteration > 0:
+                    batch_indices = self.get_batch_indices(
+                        len(train_features), self.batch_size)
+                index = batch_indices[batch_number]
+                x_train = train_features[index]
+                y_train = train_labels[index]
             else:
                 x_train = train_features
                 y_train = train_labels
 
-            norm_grad = True
-            if norm_grad:
-                var, norm_g = self.step(x_train, y_train, var, True)
-            else:
-                var = self.step(x_train, y_train, var)
-                norm_g = None
+            var, train_loss, norm_g = self.step(x_train, y_train, var)
 
-            if self.backend == "strawberryfields.tf":
+            if self.backend == "strawberryfields.tf" and \
+                    self.iteration % self.clear_cache_period == 0:
                 linecache.clearcache()
 
+            if process is not None and \
+                    process.memory_info().rss > self.memory_limit:
+                gc.collect()
+
             # early stopper
             val_loss = None
             if val_features is not None:
-                val_loss = np.asscalar(np.array(
-                    self.cost(val_features, val_labels, var)))
+                val_loss = float(cost(val_features, val_labels, var))
                 if self.early_stopper and \
                         self.iteration > 2 * self.early_stopper_patience:
                     stopping_criterion = \
@@ -337,13 +605,11 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
 
             # dump output
             if verbose:
-                train_loss = np.asscalar(np.array(
-                    self.cost(x_train, y_train, var)))
                 self.logging_iteration(val_features,
                                        val_labels,
-                                       train_loss,
+                                       float(train_loss),
                                        val_loss,
-                                       norm_g)
+                                       float(norm_g))
 
             # if snapshot enabled, save weights in file
             if self.snapshot_frequency > 0 and \
@@ -357,7 +623,16 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
                 plotter_callback(self)
 
             if stopping_criterion:
-                var = self.early_stopper.get_best_var()
+                best_var = self.early_stopper.get_best_var()
+                # tf weights are restored in place, the compiled
+                # training step holding a reference to them
+                if isinstance(var, tf.Variable):
+                    var.assign(best_var)
+                elif self.interface == "tf":
+                    for v, best_v in zip(var, best_var):
+                        v.assign(best_v)
+                else:
+                    var = best_var
                 best_iter = self.iteration - self.early_stopper_patience
                 self.logger.info("early stopper stopped - "
                                  "restoring best weights. "
@@ -376,6 +651,38 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
         if verbose:
             self.logger.info(f"elapsed time (s): {elapsed_time:.3e}")
 
+    def get_model_output(self, features):
+        """Evaluates the model with its current weights.
+
+        Without batched_neural_network, the outputs are written in place
+        into a single array, allocated with the shape and dtype of the
+        output of the first sample.
+
+        Args:
+            features (array):observations to be evaluated by the model
+
+        Returns:
+            model_output: numpy array
+                outputs of the model, of shape (n_samples,) followed by
+                the shape of the output of the circuit
+        """
+        features = self.prepare_features(features)
+        if self.interface == "jax":
+            return onp.array(self.batched_neural_network(
+                self.var, self.to_device(features)))
+        if self.batched_neural_network is not None:
+            return onp.array(self.batched_neural_network(self.var, features))
+
+        if len(features) == 0:
+            return onp.empty((0,))
+        first_output = onp.asarray(self.neural_network(self.var, features[0]))
+        model_output = onp.empty((len(features),) + first_output.shape,
+                                 dtype=first_output.dtype)
+        model_output[0] = first_output
+        for i in range(1, len(features)):
+            model_output[i] = self.neural_network(self.var, features[i])
+        return model_output
+
     def predict(self, features):
         """Predicts certain observations.
 
@@ -386,16 +693,13 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
             preds: float or int
                 prediction of the model
         """
-        model_output = np.array(
-            [self.neural_network(self.var, features=x_)
-             for x_ in features])
+        model_output = self.get_model_output(features)
 
         if self.type_problem == "classification":
-            return np.where(model_output > 0., 1, 0)
+            return onp.where(model_output > 0., 1, 0)
         elif self.type_problem == "multiclassification":
-            soft_outputs = np.exp(model_output) / \
-                           np.sum(np.exp(model_output), axis=1)[:, None]
-            return np.argmax(soft_outputs, axis=1)
+            # softmax does not change the order of the outputs
+            return onp.argmax(model_output, axis=1)
         return model_output
 
     def predict_proba(self, features):
@@ -409,20 +713,13 @@ class PennylaneNeuralNetwork(QuantumNeuralNetwork):
             preds: float or int
                 prediction of the model
         """
-        model_output = [self.neural_network(self.var, features=x_)
-                        for x_ in features]
+        model_output = self.get_model_output(features)
 
         if self.type_problem == "classification":
-            model_output = np.array(model_output)
             predicted_probabilities = 0.5 + 0.5 * model_output
 
         elif self.type_problem == "multiclassification":
-            if self.interface == "autograd":
-                predicted_probabilities = np.exp(model_output) / \
-                                          np.sum(np.exp(model_output), axis=1)[
-                                          :, None]
-            elif self.interface == "tf":
-                predicted_probabilities = tf.nn.softmax(model_output)
+            predicted_probabilities = softmax(model_output, axis=1)
         elif self.type_problem in ["regression", "reinforcement_learning"]:
             raise ValueError("Cannot predict probabilities when type_problem "
                              "is set to: "
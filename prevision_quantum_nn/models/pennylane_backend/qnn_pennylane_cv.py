@@ -33,6 +33,9 @@ class CVNeuralNetwork(PennylaneNeuralNetwork):
 
     def build(self, weights_file=None):
         """ builds the backend and the device """
+        if self.interface not in ["autograd", "tf"]:
+            raise ValueError("Invalid interface for CV neural network. "
+                             "Valid interfaces are: autograd, tf")
         super().build(weights_file=weights_file)
         # build backend
         if self.interface == "autograd":
@@ -1,15 +1,22 @@
 """ Qubit module"""
 from copy import deepcopy
+from functools import partial
 
+import numpy as onp
 import tensorflow as tf
 import pennylane as qml
 import pennylane.numpy as np
-import math
 
 from prevision_quantum_nn.models.pennylane_backend.pennylane_ansatz import \
     AnsatzBuilder
 from prevision_quantum_nn.models.pennylane_backend.qnn_pennylane \
-    import PennylaneNeuralNetwork
+    import PennylaneNeuralNetwork, import_optional
+
+# moves single qubit gates towards the beginning of the circuit
+# through controlled operations, then merges them into single Rot gates
+COMPILE_PIPELINE = [partial(qml.transforms.commute_controlled,
+                            direction="left"),
+                    qml.transforms.single_qubit_fusion]
 
 
 class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
@@ -19,6 +26,16 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
 
     Attributes:
         dev (qml.device):device to be used to train the model
+        max_bond_dim (int):maximum bond dimension of the matrix product
+            states of the lightning.tensor backend
+        single_precision (bool):if True, lightning.gpu and lightning.tensor
+            simulate the state in complex64 instead of complex128
+        compile_circuit (bool):if True, the single qubit rotations of the
+            encoding and of the ansatz are fused before execution,
+            default: True for custom ansatzes, False for template layers.
+            The derivatives of the fused Rot angles are undefined near
+            identity rotations, so that gradients may be NaN with zeros
+            or identity block initializations
     """
 
     def __init__(self, params):
@@ -41,6 +58,12 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
         self.double_mode = self.params.get("double_mode", False)
         self.variables_random_state = self.params.get("variables_random_state",
                                                       0)
+        self.max_bond_dim = self.params.get("max_bond_dim", 128)
+        self.single_precision = self.params.get("single_precision", False)
+        self.compile_circuit = self.params.get("compile_circuit", None)
+        if self.compile_circuit is None:
+            # user-defined ansatze are not written with gate count in mind
+            self.compile_circuit = self.layer_type == "custom"
         self.ansatz_builder = None
 
         self.check_encoding()
@@ -58,7 +81,10 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
                 "variables_shape",
                 "variables_init_type",
                 "double_mode",
-                "variables_random_state"]
+                "variables_random_state",
+                "max_bond_dim",
+                "single_precision",
+                "compile_circuit"]
 
     def build_model(self):
         """ builds the device and the qnode"""
@@ -98,23 +124,173 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
         self.check_backend()
 
         # build device
-        self.dev = qml.device(self.backend, wires=self.num_q)
+        c_dtype = np.complex64 if self.single_precision else np.complex128
+        if self.backend == "lightning.tensor":
+            # tensor network contraction of matrix product states,
+            # memory is bounded by the bond dimension instead of 2 ** num_q
+            self.dev = qml.device(self.backend,
+                                  wires=self.num_q,
+                                  method="mps",
+                                  max_bond_dim=self.max_bond_dim,
+                                  c_dtype=c_dtype)
+        elif self.backend == "lightning.gpu":
+            self.dev = qml.device(self.backend,
+                                  wires=self.num_q,
+                                  c_dtype=c_dtype)
+        else:
+            self.dev = qml.device(self.backend, wires=self.num_q)
+
+        # rotations of the encoding and of consecutive layers are merged
+        circuit = self.neural_network
+        if self.compile_circuit:
+            circuit = qml.compile(circuit, pipeline=COMPILE_PIPELINE)
+
+        if self.interface == "jax":
+            # jit once here so that the compilation cost is paid only
+            # at the first call of the training loop
+            jax = import_optional("jax", "jax")
+            if self.use_qjit:
+                catalyst = import_optional("catalyst", "qjit")
+                diff_method, jit, vmap = "adjoint", qml.qjit, catalyst.vmap
+            else:
+                diff_method, jit, vmap = "backprop", jax.jit, jax.vmap
+            if self.has_closed_form():
+                qnode = self.single_qubit_network
+            else:
+                qnode = qml.QNode(circuit,
+                                  self.dev,
+                                  interface="jax",
+                                  diff_method=diff_method)
+            self.neural_network = jit(qnode)
+
+            # single fused kernel evaluating the whole batch of features
+            def batched_outputs(var, features):
+                return jax.numpy.asarray(qnode(var, features))
+
+            self.batched_neural_network = jit(
+                vmap(batched_outputs, in_axes=(None, 0)))
+            self.build_train_step()
+        else:
+            diff_method = "best"
+            if self.backend == "lightning.gpu":
+                # adjoint differentiation yields the full gradient
+                # at the cost of roughly one extra forward pass
+                diff_method = "adjoint"
+            self.neural_network = qml.QNode(circuit,
+                                            self.dev,
+                                            interface=self.interface,
+                                            diff_method=diff_method)
+
+        mapped_outputs = None
+        if self.interface == "tf":
+            qnode = self.neural_network
+
+            # graph-compatible loop over the batch of features
+            def mapped_outputs(var, features):
+                return tf.map_fn(
+                    lambda x_: tf.convert_to_tensor(qnode(var, x_)),
+                    features,
+                    fn_output_signature=tf.float64)
+
+            self.batched_neural_network = mapped_outputs
+
+        if self.interface != "jax" and self.encoding != "no_encoding":
+            qnode = self.neural_network
+
+            # parameter broadcasting: a single execution of the circuit
+            # evaluates the whole batch of features
+            def batched_outputs(var, features):
+                # the batch size of a broadcast tape is read from the static
+                # shape of the features, unknown batch sizes are looped over
+                if mapped_outputs is not None and \
+                        qml.math.shape(features)[0] is None:
+                    return mapped_outputs(var, features)
+                model_output = qnode(var, features)
+                if isinstance(model_output, (list, tuple)):
+                    model_output = qml.math.stack(model_output, axis=1)
+                return model_output
+
+            self.batched_neural_network = batched_outputs
+
+        if self.interface == "tf":
+            self.build_tf_train_step()
+
+    def has_closed_form(self):
+        """Checks if the network can be evaluated without simulator.
+
+        With one qubit, StronglyEntanglingLayers reduces to a sequence of
+        Rot gates and the output of the network has an analytical
+        expression, see single_qubit_network.
+
+        Returns:
+            bool: True if single_qubit_network can replace the qnode
+        """
+        return self.interface == "jax" and \
+            not self.use_qjit and \
+            self.num_q == 1 and \
+            self.layer_type == "template" and \
+            self.layer_name == "StronglyEntanglingLayers" and \
+            self.encoding in ["angle", "no_encoding"] and \
+            self.type_problem in ["classification", "regression"]
 
-        self.neural_network = qml.QNode(self.neural_network,
-                                        self.dev,
-                                        interface=self.interface)
+    def single_qubit_network(self, var, features=None):
+        """Closed form of the one qubit neural network.
+
+        The RX angle encoding and the Rot(phi, theta, omega) layers are
+        applied to |0> as 2x2 matrices, the output being <PauliZ>.
+
+        Args:
+            var (array):weights of the model, of shape (num_layers, 1, 3)
+            features (array):observation to be passed through the network
+
+        Returns:
+            float: expectation value of PauliZ
+
+        Raises:
+            ValueError if more features than qubits are given to the angle
+                encoding, as AngleEmbedding does
+        """
+        jnp = import_optional("jax.numpy", "jax")
+        state = jnp.array([1., 0.], dtype=jnp.complex64)
+        if self.encoding == "angle":
+            # shapes are static under jit and vmap, checked at trace time
+            if jnp.shape(features)[-1] > 1:
+                raise ValueError("Features must be of length 1 or less; "
+                                 f"got length {jnp.shape(features)[-1]}.")
+            half_angle = features[0] / 2
+            state = jnp.array([jnp.cos(half_angle),
+                               -1j * jnp.sin(half_angle)])
+
+        for phi, theta, omega in var.reshape(-1, 3):
+            cos, sin = jnp.cos(theta / 2), jnp.sin(theta / 2)
+            rot = jnp.array(
+                [[jnp.exp(-0.5j * (phi + omega)) * cos,
+                  -jnp.exp(0.5j * (phi - omega)) * sin],
+                 [jnp.exp(-0.5j * (phi - omega)) * sin,
+                  jnp.exp(0.5j * (phi + omega)) * cos]])
+            state = rot @ state
+
+        return jnp.abs(state[0]) ** 2 - jnp.abs(state[1]) ** 2
 
     def check_backend(self):
         """Checks backend consistency with interface """
         autograd_backends = ["default.qubit.autograd",
                              "default.qubit",
                              "lightning.qubit",
+                             "lightning.gpu",
+                             "lightning.tensor",
                              "damavand.qubit"]
         if self.interface == "autograd" and \
                 self.backend not in autograd_backends:
             self.backend = "default.qubit.autograd"
         elif self.interface == "tf":
             self.backend = "default.qubit.tf"
+        elif self.interface == "jax":
+            # catalyst compiles for the lightning simulators only
+            if not self.use_qjit:
+                self.backend = "default.qubit.jax"
+            elif self.backend not in ["lightning.qubit", "lightning.gpu"]:
+                self.backend = "lightning.qubit"
 
     def check_encoding(self):
         """Checks encoding consistency.
@@ -136,6 +312,9 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
         """
         if weights_file is not None:
             self.load_weights(weights_file)
+            # template ansatze do not check their variables when called
+            if self.layer_type == "template":
+                self.ansatz_builder.check_shape(self.var)
         else:
             low, high = self.ansatz_builder.variables_range
             var_shape = self.ansatz_builder.variables_shape
@@ -160,12 +339,47 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
 
             if self.interface == "tf":
                 var_init = tf.Variable(var_init)
+            elif self.interface == "jax":
+                var_init = self.to_device(var_init)
             self.var = var_init
 
+    def prepare_features(self, features):
+        """Prepares observations before they are passed through the model.
+
+        StatePrep is called without normalization, mottonen observations
+        that are not unit vectors, e.g. when the preprocessor has not been
+        applied, are thus normalized here once. fit prepares the features
+        before transferring them to the jax device, so device arrays are
+        returned as they are, without any transfer back to the host.
+
+        Args:
+            features (array):observations
+
+        Returns:
+            features: array
+                observations ready to be encoded
+
+        Raises:
+            ValueError if an observation has a zero norm
+        """
+        if self.encoding != "mottonen":
+            return features
+        if self.interface == "jax" and \
+                isinstance(features, import_optional("jax", "jax").Array):
+            return features
+        features = onp.asarray(features)
+        norms = onp.linalg.norm(features, axis=1, keepdims=True)
+        if onp.allclose(norms, 1.):
+            return features
+        if onp.any(norms == 0):
+            raise ValueError("Observations of zero norm cannot be "
+                             "encoded as quantum states")
+        return features / norms
+
     def encode_data(self, features):
         """Encodes data according to encoding method."""
 
-        wires = range(self.num_q)
+        wires = self.ansatz_builder.wires
 
         # amplitude encoding mode
         if self.encoding == "amplitude":
@@ -177,10 +391,8 @@ class PennylaneQubitNeuralNetwork(PennylaneNeuralNetwork):
             qml.templates.embeddings.AngleEmbedding(features,
                                                     wires=wires)
         elif self.encoding == "mottonen":
-            norm = np.sum(np.abs(features) ** 2)
-            features = features / math.sqrt(norm)
-            qml.templates.state_preparations.MottonenStatePreparation(
-                features, wires=wires)
+            # features are normalized in prepare_features
+            qml.StatePrep(features, wires=wires, normalize=False)
         elif self.encoding == "no_encoding":
             pass
 
@@ -2,7 +2,6 @@
     provides with the base class of Quantum Neural Networks from which all
     models should inherit
 """
-from sklearn.utils import resample
 import numpy as np
 from sklearn import metrics
 import logging
@@ -196,22 +195,28 @@ class QuantumNeuralNetwork:
                                           epsilon=self.early_stopper_epsilon)
 
     @staticmethod
-    def get_random_batch(features, labels, batch_size):
-        """Get random batch.
+    def get_batch_indices(num_samples, batch_size):
+        """Get the batch indices of one epoch.
+
+        Samples are shuffled once and split into batches of batch_size,
+        the num_samples % batch_size remaining samples being dropped for
+        this epoch. If batch_size exceeds num_samples, a single batch is
+        drawn with replacement.
 
         Args:
-            features (numpy array):features to be randomly selected
-            labels (numpy array):labels to be randomly selected
+            num_samples (int):number of samples to be batched
             batch_size (int):batch size
 
         Returns:
-            features: numpy array
-                randomized batched features
-            labels: numpy array
-                randomized batched labels
+            indices: numpy array
+                indices of the samples, of shape (num_batches, batch_size)
         """
-        features, labels = resample(features, labels, n_samples=batch_size)
-        return features, labels
+        if batch_size > num_samples:
+            return np.random.choice(num_samples, (1, batch_size))
+        num_batches = num_samples // batch_size
+        permutation = np.random.permutation(num_samples)
+        return permutation[:num_batches * batch_size].reshape(num_batches,
+                                                              batch_size)
 
     def logging_iteration(self,
                           val_features,
@@ -1,6 +1,7 @@
 """ early stopper module """
 import queue
 import numpy as np
+import tensorflow as tf
 
 
 class EarlyStopper():
@@ -16,7 +17,8 @@ class EarlyStopper():
             minimum loss in the window
         best_val_loss (float):best validation loss so far in the window
         buffer (queue):keeps the weights of the models until
-            early stopper criterion is met
+            early stopper criterion is met, the weights stay on
+            the device on which they were computed
     """
     def __init__(self, window=10, epsilon=1E-4):
         """Constructor.
@@ -86,10 +88,31 @@ class EarlyStopper():
         else:
             if self.buffer.full():
                 self.buffer.get()
-            self.buffer.put(var)
+            self.buffer.put(self.keep(var))
 
         return stopping_criterion
 
+    @staticmethod
+    def keep(var):
+        """Keeps the weights of the current iteration.
+
+        Arrays are new objects at each iteration and are kept by reference.
+        tf.Variable are updated in place by the optimizer, they are copied
+        with tf.identity, which does not transfer them to the host.
+
+        Args:
+            var: (list):weights of the current iteration
+
+        Returns:
+            var: list
+                weights not modified by the next iterations
+        """
+        if isinstance(var, tf.Variable):
+            return tf.identity(var)
+        if isinstance(var, list):
+            return [EarlyStopper.keep(v) for v in var]
+        return var
+
     def get_best_var(self):
         """Returns best weights.
 
@@ -36,3 +36,24 @@ def cross_entropy(labels, predictions):
             loss -= label_ * np.log(pred_)
     loss = loss / len(labels)
     return loss
+
+
+def softmax_cross_entropy(labels, logits):
+    """ Categorical cross entropy of the softmax of logits
+
+    Computed with the log-softmax of the logits, shifted by their maximum,
+    so that no exponential overflows and no probability array is built.
+
+    Args:
+        labels (array[float]): 2-d array of one-hot labels
+        logits (array[float]): 2-d array of unnormalized predictions
+
+    Returns:
+        float: cross entropy
+    """
+    logits = logits - np.max(logits, axis=1, keepdims=True)
+    log_predictions = logits - np.log(np.sum(np.exp(logits),
+                                             axis=1,
+                                             keepdims=True))
+    loss = -np.sum(labels * log_predictions) / len(labels)
+    return loss
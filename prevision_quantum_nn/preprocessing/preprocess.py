@@ -207,6 +207,9 @@ class Preprocessor:
         # padding
         features = self.apply_padding(features)
 
+        # normalization
+        features = self.apply_normalization(features)
+
         return features
 
     def transform(self, features):
@@ -252,6 +255,9 @@ class Preprocessor:
         # padding
         features = self.apply_padding(features)
 
+        # normalization
+        features = self.apply_normalization(features)
+
         return features
 
     def compute_dimension_reduction_params(self, data_dim):
@@ -354,3 +360,23 @@ class Preprocessor:
             padding = self.padding_parameter*np.ones((obs_shape, padding_dim))
             features = np.hstack([features, padding])
         return features
+
+    def apply_normalization(self, features):
+        """Normalizes observations to be used as quantum states
+
+        Computed once here instead of at each evaluation of the circuit.
+
+        Args:
+            features (numpy array):features to be normalized
+
+        Raises:
+            ValueError if an observation has a zero norm
+        """
+        if self.encoding == "mottonen":
+            norms = np.linalg.norm(features, axis=1, keepdims=True)
+            if np.any(norms == 0):
+                raise ValueError("Observations of zero norm cannot be "
+                                 "encoded as quantum states, "
+                                 "use a non zero padding")
+            features = features / norms
+        return features
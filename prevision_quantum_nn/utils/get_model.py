@@ -50,6 +50,9 @@ def get_model_params(
         optimizer_name="Adam",
         interface="autograd",
         layer_type="template",
+        use_qjit=False,
+        clear_cache_period=50,
+        memory_limit=None,
         optimizer=None,
         var=None,
         dev=None,
@@ -64,6 +67,9 @@ def get_model_params(
         variables_init_type="default",
         double_mode=False,
         variables_random_state=0,
+        max_bond_dim=128,
+        single_precision=False,
+        compile_circuit=None,
         **kwargs):
 
     params = {'running_mode': running_mode,
@@ -86,6 +92,9 @@ def get_model_params(
               'optimizer_name': optimizer_name,
               'interface': interface,
               'layer_type': layer_type,
+              'use_qjit': use_qjit,
+              'clear_cache_period': clear_cache_period,
+              'memory_limit': memory_limit,
               'encoding': encoding,
               'optimizer': optimizer,
               'var': var,
@@ -98,7 +107,10 @@ def get_model_params(
               'variables_shape': variables_shape,
               'variables_init_type': variables_init_type,
               'double_mode': double_mode,
-              'variables_random_state': variables_random_state}
+              'variables_random_state': variables_random_state,
+              'max_bond_dim': max_bond_dim,
+              'single_precision': single_precision,
+              'compile_circuit': compile_circuit}
 
     params.update(kwargs)
 
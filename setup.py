@@ -19,6 +19,11 @@ install_requirements = [
     "imageio",
     "dill"
 ]
+extras_requirements = {
+    "jax": ["jax", "optax"],
+    "qjit": ["jax", "optax", "pennylane-catalyst"],
+    "memory": ["psutil"]
+}
 setup(name='prevision-quantum-nn',
       version='1.0.2',
       description='Prevision Automating Quantum Neural Networks Applications',
@@ -27,6 +32,7 @@ setup(name='prevision-quantum-nn',
       license='MIT',
       packages=find_packages(),
       install_requires=install_requirements,
+      extras_require=extras_requirements,
       zip_safe=False,
       python_requires = ">=3.6.8"
 )